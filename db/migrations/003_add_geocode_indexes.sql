@@ -0,0 +1,17 @@
+-- Migration: Indexes for the geocoding driver query
+-- scripts/02_geocode_hybrid.py selects WHERE nom_queried_at IS NULL ORDER BY id,
+-- optionally filtered by municipality ILIKE '%...%'. Without these, every
+-- (re)start pays a sequential scan + sort over the whole table.
+
+-- Partial index over the unprocessed subset: resumed runs find their work in
+-- an index scan already ordered by id, and the index shrinks as work completes.
+CREATE INDEX IF NOT EXISTS idx_community_centers_unqueried
+    ON community_centers(id) WHERE nom_queried_at IS NULL;
+
+-- Trigram index so the municipality ILIKE '%...%' filter can use an index
+-- instead of scanning.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_community_centers_municipality_trgm
+    ON community_centers USING gin (municipality gin_trgm_ops);
+
+-- Also add these to fresh installs via schema.sql.
@@ -114,6 +114,14 @@ CREATE INDEX idx_community_centers_settlement ON community_centers(settlement);
 CREATE INDEX idx_community_centers_nom_queried_at ON community_centers(nom_queried_at);
 CREATE INDEX idx_community_centers_g_queried_at ON community_centers(g_queried_at);
 
+-- Partial index over the not-yet-geocoded subset: the geocoder's driver query
+-- (WHERE nom_queried_at IS NULL ORDER BY id) becomes an ordered index scan
+CREATE INDEX idx_community_centers_unqueried ON community_centers(id) WHERE nom_queried_at IS NULL;
+
+-- Trigram index for the --municipality_limit ILIKE '%...%' filter
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_community_centers_municipality_trgm ON community_centers USING gin (municipality gin_trgm_ops);
+
 -- ========================================
 -- HELPER FUNCTION: Update updated_at timestamp
 -- ========================================
@@ -11,13 +11,20 @@ Usage:
 """
 
 import argparse
+import io
+import re
 import sys
 from pathlib import Path
 
 import pandas as pd
 import yaml
 from sqlalchemy import create_engine, text
-from tqdm import tqdm
+
+# Precompiled patterns for address normalization
+_STREET_RE = re.compile(r'((?:ул\.|бул\.|пл\.|кв\.|жк\.).*)', re.IGNORECASE)
+_POSTCODE_RE = re.compile(r',?\s*п\.к\.\s*\d+')
+_WS_RE = re.compile(r'\s+')
+_SETTLEMENT_PREFIX_RE = re.compile(r'^(?:СЕЛО |ГРАД |С\. |ГР\. )')
 
 
 def load_config(config_path="config/config.yaml"):
@@ -26,102 +33,85 @@ def load_config(config_path="config/config.yaml"):
         return yaml.safe_load(f)
 
 
-def clean_coordinate(value):
+def read_excel_input(xlsx_path):
     """
-    Clean coordinate values by:
-    - Converting comma to dot (e.g., "25,0516609" -> "25.0516609")
-    - Stripping whitespace
-    - Converting to float or None
+    Read the input Excel file into a DataFrame.
+
+    Prefers the Rust-based calamine engine (python-calamine, supported by
+    pandas >= 2.2), which parses XLSX several times faster than openpyxl's
+    pure-Python parser. The openpyxl fallback uses read-only mode, which
+    streams rows with an incremental parser instead of materializing the
+    whole workbook in memory.
     """
-    if pd.isna(value):
-        return None
-    
-    # Convert to string and clean
-    value_str = str(value).strip()
-    
-    # Replace comma with dot
-    value_str = value_str.replace(',', '.')
-    
-    # Try to convert to float
     try:
-        return float(value_str)
-    except (ValueError, TypeError):
-        return None
+        return pd.read_excel(xlsx_path, engine='calamine')
+    except (ImportError, ValueError):
+        # ImportError: python-calamine not installed.
+        # ValueError: pandas < 2.2 rejects 'calamine' as an unknown engine.
+        from openpyxl import load_workbook
+
+        wb = load_workbook(xlsx_path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows)
+            return pd.DataFrame(rows, columns=header)
+        finally:
+            wb.close()
 
 
-def clean_text(value):
-    """Clean text fields by stripping whitespace and handling None."""
-    if pd.isna(value):
-        return None
-    return str(value).strip()
+def clean_coordinate_column(series):
+    """
+    Clean a coordinate column by:
+    - Converting comma to dot (e.g., "25,0516609" -> "25.0516609")
+    - Stripping whitespace
+    - Converting to float (NaN for unparseable values -> NULL in the DB)
+
+    Operates on the whole Series at once (C-level string ops + to_numeric)
+    instead of calling a Python function per cell.
+    """
+    cleaned = series.astype('string').str.strip().str.replace(',', '.', regex=False)
+    return pd.to_numeric(cleaned, errors='coerce')
 
 
-def normalize_address_query(row):
+def build_address_queries(df):
     """
-    Build normalized address query string for geocoding.
-    
+    Build normalized address query strings for geocoding, vectorized over
+    the whole DataFrame instead of one Python call per row.
+
     Format: "<street>, <settlement>, <municipality>, България"
-    
+
     Example:
         "ул. Васил Левски 43, Старцево, Златоград, България"
     """
-    import re
-    
-    parts = []
-    
-    # Get the raw address
-    address = clean_text(row.get('address_raw'))
-    
-    # Extract street part (from "ул." onwards, but exclude administrative prefixes)
-    street_part = None
-    if address:
-        # Find where the actual street address starts
-        street_markers = ['ул.', 'бул.', 'пл.', 'кв.', 'жк.']
-        for marker in street_markers:
-            if marker in address.lower():
-                # Find the position of the marker
-                idx = address.lower().find(marker)
-                # Extract from marker to end
-                street_part = address[idx:].strip()
-                
-                # Remove postal code (п.к. XXXX)
-                street_part = re.sub(r',?\s*п\.к\.\s*\d+', '', street_part)
-                
-                # Clean up extra spaces and commas
-                street_part = re.sub(r'\s+', ' ', street_part).strip()
-                break
-    
-    if street_part:
-        parts.append(street_part)
-    
-    # Clean settlement name (remove СЕЛО/ГРАД prefix)
-    settlement = clean_text(row.get('settlement'))
-    if settlement:
-        settlement_clean = settlement
-        # Remove prefixes
-        for prefix in ['СЕЛО ', 'ГРАД ', 'С. ', 'ГР. ']:
-            if settlement_clean.startswith(prefix):
-                settlement_clean = settlement_clean[len(prefix):].strip()
-        
-        if settlement_clean:
-            parts.append(settlement_clean)
-    
-    # Clean municipality name (usually doesn't have prefixes)
-    municipality = clean_text(row.get('municipality'))
-    settlement_clean_upper = settlement_clean.upper() if settlement and settlement_clean else ''
-    municipality_upper = municipality.upper() if municipality else ''
-    
-    # Only add municipality if different from settlement
-    if municipality and municipality_upper != settlement_clean_upper:
-        parts.append(municipality)
-    
-    # Add country
-    parts.append('България')
-    
-    # Join with comma-space
-    query = ', '.join(parts) if parts else None
-    
-    return query
+    # Street part: from the first street marker (ул./бул./...) onwards,
+    # with the postal code (п.к. XXXX) removed and whitespace collapsed
+    street = (
+        df['address_raw'].astype('string').str.strip()
+        .str.extract(_STREET_RE, expand=False)
+        .str.replace(_POSTCODE_RE, '', regex=True)
+        .str.replace(_WS_RE, ' ', regex=True)
+        .str.strip()
+    )
+
+    # Settlement without СЕЛО/ГРАД prefixes
+    settlement = (
+        df['settlement'].astype('string').str.strip()
+        .str.replace(_SETTLEMENT_PREFIX_RE, '', regex=True)
+        .str.strip()
+    )
+
+    # Only keep municipality when different from the settlement
+    municipality = df['municipality'].astype('string').str.strip()
+    same_as_settlement = (municipality.str.upper() == settlement.str.upper()).fillna(False)
+    municipality = municipality.mask(same_as_settlement)
+
+    # Join non-missing, non-empty parts with ", " and append the country
+    query = pd.Series('', index=df.index, dtype='string')
+    for part in (street, settlement, municipality):
+        part = part.fillna('')
+        query = query + (part + ', ').where(part != '', '')
+
+    return query + 'България'
 
 
 def import_excel_to_db(xlsx_path, config):
@@ -136,7 +126,7 @@ def import_excel_to_db(xlsx_path, config):
     
     # Read Excel file
     try:
-        df = pd.read_excel(xlsx_path, engine='openpyxl')
+        df = read_excel_input(xlsx_path)
     except Exception as e:
         print(f"[ERROR] Error reading Excel file: {e}")
         sys.exit(1)
@@ -168,22 +158,42 @@ def import_excel_to_db(xlsx_path, config):
     
     # Rename columns
     df_mapped = df.rename(columns=column_mapping)
-    
+
+    # "Proceed with what we have": make sure every expected column exists
+    # (missing ones as all-NA, which COPY as NULLs) so the cleaning,
+    # address-query and COPY steps below can index them unconditionally
+    for col in column_mapping.values():
+        if col not in df_mapped.columns:
+            df_mapped[col] = pd.NA
+
     # Clean data
     print("[*] Cleaning data...")
-    
+
+    # fid arrives from Excel as float (NaN for blanks); one cast to nullable
+    # Int64 lets it COPY straight into an integer column
+    if 'fid' in df_mapped.columns:
+        df_mapped['fid'] = pd.to_numeric(df_mapped['fid'], errors='coerce').astype('Int64')
+
     # Clean coordinates
-    df_mapped['lon_src'] = df_mapped['lon_src'].apply(clean_coordinate)
-    df_mapped['lat_src'] = df_mapped['lat_src'].apply(clean_coordinate)
+    df_mapped['lon_src'] = clean_coordinate_column(df_mapped['lon_src'])
+    df_mapped['lat_src'] = clean_coordinate_column(df_mapped['lat_src'])
     
-    # Clean text fields
+    # Clean text fields (vectorized: StringDtype keeps missing values native
+    # and .str.strip runs in pandas' C loop instead of a Python call per cell)
     for col in ['name', 'address_raw', 'settlement', 'municipality', 'url']:
         if col in df_mapped.columns:
-            df_mapped[col] = df_mapped[col].apply(clean_text)
+            df_mapped[col] = df_mapped[col].astype('string').str.strip()
+
+    # Settlement and municipality names repeat heavily across the ~3,600
+    # records; categorical storage keeps one copy per distinct name and makes
+    # the equality comparisons below integer-code compares
+    for col in ('settlement', 'municipality'):
+        if col in df_mapped.columns:
+            df_mapped[col] = df_mapped[col].astype('category')
     
     # Build normalized address query
     print("[*] Building normalized address queries...")
-    df_mapped['address_query'] = df_mapped.apply(normalize_address_query, axis=1)
+    df_mapped['address_query'] = build_address_queries(df_mapped)
     
     # Connect to database
     print("[*] Connecting to database...")
@@ -192,80 +202,105 @@ def import_excel_to_db(xlsx_path, config):
     
     # Insert data
     print("[*] Inserting data into database...")
-    
+
+    # Build EWKT geometry strings (converted to geometry server-side),
+    # vectorized: one masked string concatenation instead of a per-row f-string
+    has_coords = df_mapped['lon_src'].notna() & df_mapped['lat_src'].notna()
+    df_mapped['geom_src_ewkt'] = pd.Series(pd.NA, index=df_mapped.index, dtype='string')
+    df_mapped.loc[has_coords, 'geom_src_ewkt'] = (
+        'SRID=4326;POINT('
+        + df_mapped.loc[has_coords, 'lon_src'].astype(str)
+        + ' '
+        + df_mapped.loc[has_coords, 'lat_src'].astype(str)
+        + ')'
+    )
+
+    copy_cols = [
+        'fid', 'name', 'address_raw', 'settlement', 'municipality', 'url',
+        'lon_src', 'lat_src', 'geom_src_ewkt', 'address_query'
+    ]
+
+    # Serialize to an in-memory CSV and stream it with a single COPY instead
+    # of one INSERT round trip per row
+    buf = io.StringIO()
+    df_mapped[copy_cols].to_csv(buf, na_rep='\\N', header=False, index=False)
+    buf.seek(0)
+
     inserted_count = 0
-    updated_count = 0
-    error_count = 0
-    
-    with engine.connect() as conn:
-        for idx, row in tqdm(df_mapped.iterrows(), total=len(df_mapped), desc="Importing"):
-            try:
-                # Build geometry from coordinates (if available)
-                geom_wkt = None
-                if row['lon_src'] is not None and row['lat_src'] is not None:
-                    geom_wkt = f"SRID=4326;POINT({row['lon_src']} {row['lat_src']})"
-                
-                # Insert query (id will auto-increment)
-                query = text("""
-                    INSERT INTO community_centers (
-                        fid, name, address_raw, settlement, municipality, url,
-                        lon_src, lat_src, geom_src, address_query
-                    ) VALUES (
-                        :fid, :name, :address_raw, :settlement, :municipality, :url,
-                        :lon_src, :lat_src, ST_GeomFromEWKT(:geom_src), :address_query
-                    )
-                """)
-                
-                result = conn.execute(query, {
-                    'fid': int(row['fid']) if pd.notna(row['fid']) else None,
-                    'name': row.get('name'),
-                    'address_raw': row.get('address_raw'),
-                    'settlement': row.get('settlement'),
-                    'municipality': row.get('municipality'),
-                    'url': row.get('url'),
-                    'lon_src': row.get('lon_src'),
-                    'lat_src': row.get('lat_src'),
-                    'geom_src': geom_wkt,
-                    'address_query': row.get('address_query')
-                })
-                
-                inserted_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                print(f"\n[WARNING] Error inserting row {idx} (fid={row.get('fid')}): {e}")
-                if error_count > 10:
-                    print("[ERROR] Too many errors, stopping import")
-                    break
-        
-        # Commit transaction
-        conn.commit()
-    
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            # The whole import runs in one transaction; skip the WAL fsync on
+            # commit (worst case on a crash: this import is lost and re-run)
+            cur.execute("SET LOCAL synchronous_commit = off")
+            # COPY into a staging table first: geom_src arrives as EWKT text;
+            # one INSERT ... SELECT converts it and lands the rows in
+            # community_centers
+            cur.execute("""
+                CREATE TEMP TABLE community_centers_staging (
+                    fid INTEGER,
+                    name TEXT,
+                    address_raw TEXT,
+                    settlement TEXT,
+                    municipality TEXT,
+                    url TEXT,
+                    lon_src DOUBLE PRECISION,
+                    lat_src DOUBLE PRECISION,
+                    geom_src_ewkt TEXT,
+                    address_query TEXT
+                ) ON COMMIT DROP
+            """)
+            cur.copy_expert(
+                """
+                COPY community_centers_staging (
+                    fid, name, address_raw, settlement, municipality, url,
+                    lon_src, lat_src, geom_src_ewkt, address_query
+                ) FROM STDIN WITH (FORMAT csv, NULL '\\N')
+                """,
+                buf
+            )
+            cur.execute("""
+                INSERT INTO community_centers (
+                    fid, name, address_raw, settlement, municipality, url,
+                    lon_src, lat_src, geom_src, address_query
+                )
+                SELECT fid, name, address_raw, settlement, municipality, url,
+                       lon_src, lat_src, ST_GeomFromEWKT(geom_src_ewkt), address_query
+                FROM community_centers_staging
+            """)
+            inserted_count = cur.rowcount
+        raw_conn.commit()
+    except Exception as e:
+        raw_conn.rollback()
+        print(f"[ERROR] Bulk insert failed: {e}")
+        sys.exit(1)
+    finally:
+        raw_conn.close()
+
     print(f"\n[OK] Import completed!")
     print(f"   Total rows: {len(df_mapped)}")
     print(f"   Successfully inserted: {inserted_count}")
-    print(f"   Errors: {error_count}")
     
-    # Show sample data
-    print("\n[*] Sample of imported data:")
+    # Show sample data and statistics (one connection for both queries)
     with engine.connect() as conn:
+        print("\n[*] Sample of imported data:")
         result = conn.execute(text("""
-            SELECT id, fid, name, settlement, municipality, 
+            SELECT id, fid, name, settlement, municipality,
                    lon_src, lat_src, address_query
             FROM community_centers
             ORDER BY id
             LIMIT 5
         """))
-        
+
         for row in result:
             print(f"   ID {row.id}, FID {row.fid}: {row.name} - {row.settlement}")
             print(f"      Coords: ({row.lon_src}, {row.lat_src})")
             print(f"      Query: {row.address_query}")
             print()
-    
-    # Show statistics
-    print("[*] Database statistics:")
-    with engine.connect() as conn:
+
+        # Show statistics
+        print("[*] Database statistics:")
         result = conn.execute(text("""
             SELECT 
                 COUNT(*) as total,
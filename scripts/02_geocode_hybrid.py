@@ -13,17 +13,74 @@ Usage:
 """
 
 import argparse
+import collections
+import functools
 import json
+import re
 import sqlite3
 import sys
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import requests
 import yaml
+from requests.adapters import HTTPAdapter
 from sqlalchemy import create_engine, text
 from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+# orjson (C implementation) serializes the large raw API responses several
+# times faster than stdlib json; fall back silently when not installed
+try:
+    import orjson
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    json_loads = orjson.loads
+except ImportError:
+    json_dumps = json.dumps
+    json_loads = json.loads
+
+
+def create_http_session():
+    """
+    Create a requests.Session with pooled connections and retries.
+
+    Keep-alive avoids a fresh DNS lookup and TLS handshake per geocoding
+    call; transient HTTP errors (429/5xx) are retried with backoff.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # On 429/503 sleep for however long the server asks via
+            # Retry-After instead of hammering with the fixed backoff
+            respect_retry_after_header=True,
+        )
+    )
+    # Mount both schemes: a self-hosted Nominatim base_url is plain http
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _first_address_value(address, keys):
+    """Return the first non-empty string among address[key] for the given keys."""
+    for key in keys:
+        value = address.get(key)
+        if isinstance(value, str):
+            value = value.strip()
+            if value:
+                return value
+    return None
 
 
 def extract_nominatim_address_parts(raw_result):
@@ -42,39 +99,25 @@ def extract_nominatim_address_parts(raw_result):
     if not isinstance(address, dict):
         return (None, None, None)
 
-    # Settlement: village, town, city (OSM place levels); fallback locality
-    settlement = (
-        address.get('village') or
-        address.get('town') or
-        address.get('city') or
-        address.get('locality')
-    )
-    if settlement and isinstance(settlement, str):
-        settlement = settlement.strip() or None
-    else:
-        settlement = None
-
-    # Municipality (община): municipality or county
-    municipality = address.get('municipality') or address.get('county')
-    if municipality and isinstance(municipality, str):
-        municipality = municipality.strip() or None
-    else:
-        municipality = None
-
-    # Region (област): state, state_district, region
-    region = (
-        address.get('state') or
-        address.get('state_district') or
-        address.get('region')
+    return (
+        # Settlement: village, town, city (OSM place levels); fallback locality
+        _first_address_value(address, ('village', 'town', 'city', 'locality')),
+        # Municipality (община): municipality or county
+        _first_address_value(address, ('municipality', 'county')),
+        # Region (област): state, state_district, region
+        _first_address_value(address, ('state', 'state_district', 'region')),
     )
-    if region and isinstance(region, str):
-        region = region.strip() or None
-    else:
-        region = None
 
-    return (settlement, municipality, region)
+
+# Leading settlement-type tokens skipped when extracting the municipality name
+_MUNI_SKIP_TOKENS = frozenset(('СЕЛО', 'ГРАД', 'С.', 'ГР.'))
+
+# Leading "СЕЛО "/"ГРАД " prefix on the Excel settlement value (same shape as
+# the normalization in 01_import_excel_to_pg.py)
+_SETTLEMENT_PREFIX_RE = re.compile(r'^(?:СЕЛО |ГРАД )')
 
 
+@functools.lru_cache(maxsize=4096)
 def normalize_municipality_for_nominatim(municipality):
     """
     Normalize Excel "Община" value to a short name suitable for Nominatim structured search (county).
@@ -82,92 +125,238 @@ def normalize_municipality_for_nominatim(municipality):
     Excel often has long strings like "община БУРГАС СЕЛО ИЗВОР Михаи" (address fragment).
     Nominatim only matches real admin names (e.g. "Бургас"), so we extract the first
     meaningful word after "община " to use as county= in structured search.
+
+    Cached: a handful of distinct municipality strings cover thousands of rows,
+    so after the first pass each call is a dict lookup.
     """
     if not municipality or not isinstance(municipality, str):
         return None
     s = municipality.strip()
     if not s:
         return None
-    # Strip leading "община " (case-insensitive)
-    for prefix in ('община ', 'ОБЩИНА ', 'Община '):
-        if s.upper().startswith(prefix.upper()):
-            s = s[len(prefix):].strip()
-            break
+    # Strip leading "община " (one case-insensitive comparison covers every casing)
+    if s[:7].casefold() == 'община ':
+        s = s[7:].lstrip()
     if not s:
         return None
     words = s.split()
     # Skip leading settlement-type tokens (СЕЛО, ГРАД, etc.) so we get the actual municipality name
-    skip = ('СЕЛО', 'ГРАД', 'С.', 'ГР.')
-    while words and words[0].upper().strip() in skip:
-        words = words[1:]
-    first_word = words[0] if words else None
+    i = 0
+    while i < len(words) and words[i].upper() in _MUNI_SKIP_TOKENS:
+        i += 1
+    first_word = words[i] if i < len(words) else None
     if not first_word or len(first_word) > 80:
         return None
-    return first_word.strip()
+    return first_word
 
 
 class GeocoderCache:
-    """SQLite cache for geocoding responses."""
-    
+    """
+    SQLite cache for geocoding responses with an in-memory LRU layer.
+
+    One cache database serves both providers: entries are keyed by
+    (provider, address_query), so a single connection, WAL, and preload
+    pass cover Nominatim and Google together.
+    """
+
+    # Repeated lookups in one run (e.g. shared fallback queries) are served
+    # from this many in-process entries before touching SQLite
+    MEM_CACHE_SIZE = 2048
+
+    # Commit cache inserts in groups instead of one fsync per set(); a crash
+    # loses at most this many cacheable responses, which just get re-fetched
+    FLUSH_EVERY = 50
+
+    # Entries expire so the table does not grow forever: failures are worth
+    # retrying after a week (the provider may have new data), successes are
+    # kept much longer
+    TTL_SUCCESS_DAYS = 180
+    TTL_FAILURE_DAYS = 7
+
     def __init__(self, cache_path):
         self.cache_path = cache_path
         self.cache_path.parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(str(cache_path))
+        self.conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+        self._mem = collections.OrderedDict()
+        self._mem_cap = self.MEM_CACHE_SIZE
+        # The Google pass reads/writes the cache from worker threads
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        # Full key set, filled by preload(); lets get() declare a miss
+        # without an SQLite probe even after the LRU has evicted entries
+        self._known_keys = set()
+        self._preloaded = False
         self._init_db()
-    
+
     def _init_db(self):
         """Initialize cache database."""
+        # WAL + NORMAL turns each cache write into a WAL append instead of a
+        # rewrite-and-fsync; mmap/page-cache settings cheapen reads
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA mmap_size=268435456")  # 256MB
+        self.conn.execute("PRAGMA cache_size=-65536")    # 64MB page cache
+        self.conn.execute("PRAGMA busy_timeout=60000")   # wait instead of SQLITE_BUSY
         self.conn.execute("""
             CREATE TABLE IF NOT EXISTS cache (
-                address_query TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                address_query TEXT NOT NULL,
                 response_json TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                expires_at DATETIME,
+                PRIMARY KEY (provider, address_query)
             )
         """)
+        # Cache files created before expires_at existed get the column added
+        # in place (NULL = never expires, matching the old behaviour)
+        try:
+            self.conn.execute("ALTER TABLE cache ADD COLUMN expires_at DATETIME")
+        except sqlite3.OperationalError:
+            pass  # column already exists
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at)"
+        )
         self.conn.commit()
     
-    def get(self, address_query):
-        """Get cached response for address."""
+    def _mem_store(self, key, response_data):
+        """Insert into the in-memory LRU, evicting the oldest entry when full."""
+        self._mem[key] = response_data
+        self._mem.move_to_end(key)
+        if len(self._mem) > self._mem_cap:
+            self._mem.popitem(last=False)
+
+    def preload(self):
+        """
+        Load all cached entries into the in-memory layer up front.
+
+        On resumed runs every already-geocoded record replays as a plain
+        dict lookup instead of a per-record SQLite probe. The LRU capacity
+        is widened to hold the preloaded set.
+        """
         cursor = self.conn.execute(
-            "SELECT response_json FROM cache WHERE address_query = ?",
-            (address_query,)
+            "SELECT provider, address_query, response_json FROM cache "
+            "WHERE expires_at IS NULL OR expires_at > datetime('now')"
         )
-        row = cursor.fetchone()
-        if row:
-            return json.loads(row[0])
+        for provider, address_query, response_json in cursor:
+            self._mem[(provider, address_query)] = json_loads(response_json)
+        self._mem_cap = max(self._mem_cap, len(self._mem) + 256)
+        self._known_keys = set(self._mem)
+        self._preloaded = True
+        return len(self._mem)
+
+    def get(self, provider, address_query):
+        """Get cached response for a provider/address (memory first, then SQLite)."""
+        key = (provider, address_query)
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                return self._mem[key]
+
+            # After preload the key set is complete: an unknown key is a
+            # definite miss, no B-tree descent needed
+            if self._preloaded and key not in self._known_keys:
+                return None
+
+            cursor = self.conn.execute(
+                "SELECT response_json FROM cache WHERE provider = ? AND address_query = ? "
+                "AND (expires_at IS NULL OR expires_at > datetime('now'))",
+                key
+            )
+            row = cursor.fetchone()
+            if row:
+                response_data = json_loads(row[0])
+                self._mem_store(key, response_data)
+                return response_data
         return None
-    
-    def set(self, address_query, response_data):
-        """Cache response for address."""
-        self.conn.execute(
-            """
-            INSERT OR REPLACE INTO cache (address_query, response_json, timestamp)
-            VALUES (?, ?, ?)
-            """,
-            (address_query, json.dumps(response_data), datetime.now().isoformat())
-        )
-        self.conn.commit()
-    
+
+    def set(self, provider, address_query, response_data):
+        """Cache response for a provider/address with a TTL based on outcome."""
+        payload = json_dumps(response_data)
+        ttl_days = (self.TTL_SUCCESS_DAYS if response_data.get('success')
+                    else self.TTL_FAILURE_DAYS)
+        expires_at = (datetime.now(timezone.utc) + timedelta(days=ttl_days)
+                      ).strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO cache (provider, address_query, response_json, expires_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (provider, address_query, payload, expires_at)
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.FLUSH_EVERY:
+                self.conn.commit()
+                self._pending_writes = 0
+            self._known_keys.add((provider, address_query))
+            self._mem_store((provider, address_query), response_data)
+
+    def evict_expired(self):
+        """Delete expired entries (indexed on expires_at); returns the count."""
+        with self._lock:
+            cursor = self.conn.execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < datetime('now')"
+            )
+            self.conn.commit()
+        return cursor.rowcount
+
+    def flush(self):
+        """Commit any buffered cache writes."""
+        with self._lock:
+            if self._pending_writes:
+                self.conn.commit()
+                self._pending_writes = 0
+
     def close(self):
-        """Close database connection."""
+        """Flush buffered writes and close the database connection."""
+        self.flush()
         self.conn.close()
 
 
 class NominatimGeocoder:
     """Nominatim geocoding with rate limiting and caching."""
-    
-    def __init__(self, config, cache_path):
+
+    PROVIDER = 'nominatim'
+
+    # Confidence-scoring lookup tables (see _calculate_confidence)
+    _CLASS_BONUS = {'building': 20, 'amenity': 20, 'tourism': 20, 'leisure': 20}
+    _PRECISE_TYPES = frozenset(('house', 'residential', 'commercial'))
+    _SETTLEMENT_TYPES = frozenset(('village', 'town', 'city'))
+    _PRECISE_OSM_TYPES = frozenset(('way', 'node'))
+
+    def __init__(self, config, cache):
         self.config = config['nominatim']
-        self.cache = GeocoderCache(cache_path)
+        self.cache = cache
+        self.session = create_http_session()
+        # Nominatim's usage policy requires an identifying User-Agent; set it
+        # once on the pooled session instead of building a dict per request
+        self.session.headers['User-Agent'] = self.config['user_agent']
         self.last_request_time = 0
+        # Per-run memo for free-form queries: the settlement-level fallbacks
+        # ("<settlement>, България") repeat for every record in a settlement,
+        # and each repeat would otherwise cost a rate-limited round trip
+        self._freeform_memo = {}
     
     def _rate_limit(self):
-        """Enforce rate limiting (1 req/sec for Nominatim)."""
+        """
+        Enforce rate limiting (1 req/sec for Nominatim).
+
+        Uses time.monotonic() so NTP adjustments to the wall clock can
+        neither stall the pipeline nor burst past the quota. Cache and memo
+        hits never reach this, so only real requests pay the wait — and the
+        DB batch writes between requests already count against the budget.
+
+        A self-hosted Nominatim has no such policy: set rate_limit_seconds
+        to 0 (or negative) in the config to disable the wait entirely.
+        """
         rate_limit = self.config.get('rate_limit_seconds', 1.0)
-        elapsed = time.time() - self.last_request_time
-        if elapsed < rate_limit:
-            time.sleep(rate_limit - elapsed)
-        self.last_request_time = time.time()
+        if rate_limit <= 0:
+            return
+        remaining = self.last_request_time + rate_limit - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.last_request_time = time.monotonic()
     
     def geocode(self, address_query, settlement=None, municipality=None):
         """
@@ -197,13 +386,13 @@ class NominatimGeocoder:
         cache_key = address_query
         if municipality:
             cache_key = f"{address_query}|municipality:{municipality_for_structured or municipality_clean or ''}"
-        cached = self.cache.get(cache_key)
+        cached = self.cache.get(self.PROVIDER, cache_key)
         if cached is not None:
             return cached
 
         settlement_clean = None
         if settlement:
-            settlement_clean = settlement.replace('СЕЛО ', '').replace('ГРАД ', '').strip()
+            settlement_clean = _SETTLEMENT_PREFIX_RE.sub('', settlement).strip()
 
         queries_to_try = [address_query]
         if settlement_clean and municipality_clean:
@@ -241,7 +430,7 @@ class NominatimGeocoder:
                 'queries_tried': queries_to_try
             }
 
-        self.cache.set(cache_key, result_data)
+        self.cache.set(self.PROVIDER, cache_key, result_data)
         return result_data
 
     def _nominatim_request_structured(self, city, county, country, address_query):
@@ -259,16 +448,14 @@ class NominatimGeocoder:
             'limit': 1,
             'addressdetails': 1
         }
-        headers = {'User-Agent': self.config['user_agent']}
         try:
-            response = requests.get(
+            response = self.session.get(
                 self.config['base_url'],
                 params=params,
-                headers=headers,
                 timeout=10
             )
             response.raise_for_status()
-            results = response.json()
+            results = json_loads(response.content)
             if not results or len(results) == 0:
                 return None
             result = results[0]
@@ -293,7 +480,29 @@ class NominatimGeocoder:
             return None
 
     def _nominatim_request_freeform(self, query_attempt, address_query):
-        """Nominatim free-form search (q=)."""
+        """
+        Nominatim free-form search (q=), memoized per run.
+
+        The same fallback query (e.g. "<settlement>, България") is built for
+        every record in a settlement; after the first network round trip the
+        memo answers the rest. The fallback confidence penalty is applied per
+        call since it depends on the record's own address_query.
+        """
+        if query_attempt in self._freeform_memo:
+            result_data = self._freeform_memo[query_attempt]
+        else:
+            result_data = self._fetch_freeform(query_attempt)
+            self._freeform_memo[query_attempt] = result_data
+
+        if result_data is None:
+            return None
+        result_data = dict(result_data)
+        if query_attempt != address_query:
+            result_data['confidence'] = max(result_data['confidence'] - 20, 30)
+        return result_data
+
+    def _fetch_freeform(self, query_attempt):
+        """Issue a free-form Nominatim request over the network."""
         self._rate_limit()
         params = {
             'q': query_attempt,
@@ -302,24 +511,20 @@ class NominatimGeocoder:
             'limit': 1,
             'addressdetails': 1
         }
-        headers = {'User-Agent': self.config['user_agent']}
         try:
-            response = requests.get(
+            response = self.session.get(
                 self.config['base_url'],
                 params=params,
-                headers=headers,
                 timeout=10
             )
             response.raise_for_status()
-            results = response.json()
+            results = json_loads(response.content)
             if not results or len(results) == 0:
                 return None
             result = results[0]
             lat = float(result.get('lat', 0))
             lon = float(result.get('lon', 0))
-            confidence = self._calculate_confidence(result, address_query)
-            if query_attempt != address_query:
-                confidence = max(confidence - 20, 30)
+            confidence = self._calculate_confidence(result, query_attempt)
             return {
                 'success': True,
                 'lat': lat,
@@ -350,45 +555,73 @@ class NominatimGeocoder:
         """
         score = 40  # Base score for having a result
         
-        # Check if it's a precise location (not just administrative)
+        # Check if it's a precise location (not just administrative);
+        # lookup tables/sets replace the list scans in the old if-chain
         osm_class = result.get('class', '').lower()
         osm_type = result.get('type', '').lower()
-        
-        if osm_class in ['building', 'amenity', 'tourism', 'leisure']:
-            score += 20
-        elif osm_class == 'highway' or osm_type in ['house', 'residential', 'commercial']:
+
+        class_bonus = self._CLASS_BONUS.get(osm_class)
+        if class_bonus:
+            score += class_bonus
+        elif osm_class == 'highway' or osm_type in self._PRECISE_TYPES:
             score += 15
-        elif osm_class == 'place' and osm_type in ['village', 'town', 'city']:
+        elif osm_class == 'place' and osm_type in self._SETTLEMENT_TYPES:
             score += 5  # Just a municipality/settlement, less precise
-        
+
         # Check importance
-        importance = result.get('importance', 0)
-        if importance >= 0.4:
+        if result.get('importance', 0) >= 0.4:
             score += 10
-        
+
         # Check OSM type (way/node are more precise than relation)
-        result_osm_type = result.get('osm_type', '').lower()
-        if result_osm_type in ['way', 'node']:
+        if result.get('osm_type', '').lower() in self._PRECISE_OSM_TYPES:
             score += 10
-        
+
         # Bonus for having address details
         address = result.get('address', {})
         if address.get('house_number') or address.get('street') or address.get('road'):
             score += 10
-        
+
         return min(score, 100)  # Cap at 100
     
     def close(self):
-        """Close cache connection."""
-        self.cache.close()
+        """Close HTTP connections (the shared cache is closed by the caller)."""
+        self.session.close()
 
 
 class GoogleGeocoder:
-    """Google Geocoding API with caching."""
-    
-    def __init__(self, config, cache_path):
+    """Google Geocoding API with caching and a circuit breaker."""
+
+    PROVIDER = 'google'
+
+    # Unlike Nominatim, Google has no 1 req/s policy, so queued fallback
+    # lookups can run concurrently (the loop is purely I/O-bound)
+    MAX_WORKERS = 8
+
+    # Open the circuit after this many consecutive failures; while open,
+    # calls short-circuit instead of each paying the request timeout
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_COOLDOWN_SECONDS = 60
+
+    # Statuses that indicate Google itself is unavailable or refusing us
+    # (ZERO_RESULTS is a healthy answer and must not trip the breaker)
+    OUTAGE_STATUSES = {'OVER_QUERY_LIMIT', 'OVER_DAILY_LIMIT', 'REQUEST_DENIED', 'UNKNOWN_ERROR'}
+
+    # Confidence by location_type (see _calculate_confidence)
+    _CONFIDENCE_MAP = {
+        'ROOFTOP': 95,
+        'RANGE_INTERPOLATED': 80,
+        'GEOMETRIC_CENTER': 60,
+        'APPROXIMATE': 40
+    }
+
+    def __init__(self, config, cache):
         self.config = config['google']
-        self.cache = GeocoderCache(cache_path)
+        self.cache = cache
+        self.session = create_http_session()
+        # Breaker state is shared across the worker threads
+        self._breaker_lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0
     
     def geocode(self, address_query):
         """
@@ -398,10 +631,21 @@ class GoogleGeocoder:
             dict with keys: success, lat, lon, raw_json, confidence
         """
         # Check cache first
-        cached = self.cache.get(address_query)
+        cached = self.cache.get(self.PROVIDER, address_query)
         if cached is not None:
             return cached
-        
+
+        # Circuit open: skip the call entirely (and don't cache the synthetic
+        # failure, so the record is retried once Google recovers)
+        if time.time() < self.circuit_open_until:
+            return {
+                'success': False,
+                'lat': None,
+                'lon': None,
+                'confidence': 0,
+                'raw_json': {'error': 'Circuit breaker open: Google temporarily skipped'}
+            }
+
         # Make request to Google
         params = {
             'address': address_query,
@@ -411,14 +655,14 @@ class GoogleGeocoder:
         }
         
         try:
-            response = requests.get(
+            response = self.session.get(
                 'https://maps.googleapis.com/maps/api/geocode/json',
                 params=params,
                 timeout=10
             )
             response.raise_for_status()
             
-            result_json = response.json()
+            result_json = json_loads(response.content)
             
             if result_json.get('status') == 'OK' and result_json.get('results'):
                 result = result_json['results'][0]
@@ -451,22 +695,38 @@ class GoogleGeocoder:
                     'confidence': 0,
                     'raw_json': result_json
                 }
-            
+
+            if result_json.get('status') in self.OUTAGE_STATUSES:
+                self._record_failure()
+            else:
+                with self._breaker_lock:
+                    self.consecutive_failures = 0
+
             # Cache the result (including failures)
-            self.cache.set(address_query, data)
+            self.cache.set(self.PROVIDER, address_query, data)
             return data
-            
+
         except Exception as e:
-            # Cache the error too
-            data = {
+            self._record_failure()
+            # Do not cache transient network errors: a timeout today should
+            # not suppress a retry of this address on the next run
+            return {
                 'success': False,
                 'lat': None,
                 'lon': None,
                 'confidence': 0,
                 'raw_json': {'error': str(e)}
             }
-            self.cache.set(address_query, data)
-            return data
+
+    def _record_failure(self):
+        """Count a failure and open the circuit when the threshold is hit."""
+        with self._breaker_lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.CIRCUIT_FAILURE_THRESHOLD:
+                self.circuit_open_until = time.time() + self.CIRCUIT_COOLDOWN_SECONDS
+                self.consecutive_failures = 0
+                print(f"\n[WARNING] Google failing repeatedly; "
+                      f"skipping calls for {self.CIRCUIT_COOLDOWN_SECONDS}s")
     
     def _calculate_confidence(self, result):
         """
@@ -478,20 +738,11 @@ class GoogleGeocoder:
         - GEOMETRIC_CENTER: 60
         - APPROXIMATE: 40
         """
-        location_type = result['geometry'].get('location_type', 'APPROXIMATE')
-        
-        confidence_map = {
-            'ROOFTOP': 95,
-            'RANGE_INTERPOLATED': 80,
-            'GEOMETRIC_CENTER': 60,
-            'APPROXIMATE': 40
-        }
-        
-        return confidence_map.get(location_type, 40)
+        return self._CONFIDENCE_MAP.get(result['geometry'].get('location_type'), 40)
     
     def close(self):
-        """Close cache connection."""
-        self.cache.close()
+        """Close HTTP connections (the shared cache is closed by the caller)."""
+        self.session.close()
 
 
 def load_config(config_path="config/config.yaml"):
@@ -509,16 +760,22 @@ def geocode_records(config, limit=None, municipality_limit=None):
         limit: Maximum number of records to process (None for all)
         municipality_limit: Filter by municipality name (partial match)
     """
-    # Initialize geocoders
-    nominatim = NominatimGeocoder(
-        config,
-        Path('data/cache/nominatim_cache.sqlite')
-    )
-    google = GoogleGeocoder(
-        config,
-        Path('data/cache/google_cache.sqlite')
-    )
-    
+    # One cache database (and connection) serves both geocoders
+    cache = GeocoderCache(Path('data/cache/geocode_cache.sqlite'))
+    nominatim = NominatimGeocoder(config, cache)
+    google = GoogleGeocoder(config, cache)
+
+    # Drop expired entries (week-old failures etc.), then warm the in-memory
+    # cache layer so resumed runs replay prior results without touching
+    # SQLite per record
+    evicted = cache.evict_expired()
+    if evicted:
+        print(f"[*] Evicted {evicted} expired cache entries")
+    preloaded = cache.preload()
+    if preloaded:
+        print(f"[*] Preloaded {preloaded} cached responses")
+
+
     # Connect to database
     db_url = config['db']['url']
     engine = create_engine(db_url)
@@ -536,49 +793,132 @@ def geocode_records(config, limit=None, municipality_limit=None):
         print(f"[*] Filtering by municipality: {municipality_limit}")
     
     where_sql = " AND ".join(where_clauses)
-    
+
+    select_sql = f"""
+        SELECT id, address_query, settlement, municipality
+        FROM community_centers
+        WHERE {where_sql}
+        ORDER BY id
+    """
+    if limit:
+        select_sql += " LIMIT :limit"
+        params['limit'] = limit
+
+    # Count first (for the progress bar), then stream the rows with a
+    # server-side cursor so memory stays bounded and the first geocode
+    # fires before the whole result set materializes
     with engine.connect() as conn:
-        if limit:
-            query = text(f"""
-                SELECT id, address_query, settlement, municipality
-                FROM community_centers
-                WHERE {where_sql}
-                ORDER BY id
-                LIMIT :limit
-            """)
-            params['limit'] = limit
-            result = conn.execute(query, params)
-        else:
-            query = text(f"""
-                SELECT id, address_query, settlement, municipality
-                FROM community_centers
-                WHERE {where_sql}
-                ORDER BY id
-            """)
-            result = conn.execute(query, params)
-        
-        records = result.fetchall()
-    
-    if not records:
+        total = conn.execute(
+            text(f"SELECT COUNT(*) FROM ({select_sql}) AS pending"), params
+        ).scalar()
+
+    if not total:
         print("[OK] No records to geocode!")
         return
-    
-    print(f"[*] Found {len(records)} records to geocode")
-    
+
+    print(f"[*] Found {total} records to geocode")
+
+    read_conn = engine.connect()
+    records = read_conn.execution_options(yield_per=500).execute(text(select_sql), params)
+
     # Thresholds
     min_confidence = config['thresholds'].get('min_confidence', 60)
-    
+
     # Process each record
     stats = {
-        'total': len(records),
+        'total': total,
         'nominatim_success': 0,
         'nominatim_failed': 0,
         'google_called': 0,
         'google_success': 0,
         'google_failed': 0
     }
-    
-    for record in tqdm(records, desc="Geocoding"):
+
+    # Accumulate UPDATE parameters and flush them in batches: one
+    # executemany per statement inside a single transaction instead of a
+    # connection checkout + commit (fsync) per record
+    flush_every = 200
+    nom_updates = []
+    combined_updates = []
+
+    nom_update_query = text("""
+        UPDATE community_centers
+        SET
+            lon_nom = :lon_nom,
+            lat_nom = :lat_nom,
+            -- ST_MakePoint/ST_SetSRID are STRICT: NULL lon/lat yields NULL,
+            -- so no CASE is needed and lon/lat bind once each
+            geom_nom = ST_SetSRID(ST_MakePoint(:lon_nom, :lat_nom), 4326),
+            nom_display_name = :display_name,
+            nom_osm_type = :osm_type,
+            nom_osm_id = :osm_id,
+            nom_importance = :importance,
+            nom_class = :class,
+            nom_type = :type,
+            nom_confidence = :confidence,
+            nom_raw_json = :raw_json,
+            nom_settlement = :nom_settlement,
+            nom_municipality = :nom_municipality,
+            nom_region = :nom_region,
+            nom_query_used = :nom_query_used,
+            nom_queried_at = NOW(),
+            updated_at = NOW()
+        WHERE id = :id
+    """)
+
+    # Records that take the Google fallback get a single UPDATE carrying
+    # both column sets, instead of one UPDATE per provider
+    combined_update_query = text("""
+        UPDATE community_centers
+        SET
+            lon_nom = :lon_nom,
+            lat_nom = :lat_nom,
+            geom_nom = ST_SetSRID(ST_MakePoint(:lon_nom, :lat_nom), 4326),
+            nom_display_name = :display_name,
+            nom_osm_type = :osm_type,
+            nom_osm_id = :osm_id,
+            nom_importance = :importance,
+            nom_class = :class,
+            nom_type = :type,
+            nom_confidence = :confidence,
+            nom_raw_json = :raw_json,
+            nom_settlement = :nom_settlement,
+            nom_municipality = :nom_municipality,
+            nom_region = :nom_region,
+            nom_query_used = :nom_query_used,
+            nom_queried_at = NOW(),
+            lon_g = :lon_g,
+            lat_g = :lat_g,
+            geom_g = ST_SetSRID(ST_MakePoint(:lon_g, :lat_g), 4326),
+            g_formatted_address = :formatted_address,
+            g_place_id = :place_id,
+            g_location_type = :location_type,
+            g_types = :types,
+            g_confidence = :g_confidence,
+            g_raw_json = :g_raw_json,
+            g_queried_at = NOW(),
+            updated_at = NOW()
+        WHERE id = :id
+    """)
+
+    def flush_updates():
+        """Write accumulated Nominatim/Google updates in one transaction."""
+        if not nom_updates and not combined_updates:
+            return
+        with engine.begin() as conn:
+            if nom_updates:
+                conn.execute(nom_update_query, nom_updates)
+            if combined_updates:
+                conn.execute(combined_update_query, combined_updates)
+        nom_updates.clear()
+        combined_updates.clear()
+
+    # Records that need the Google fallback are collected during the
+    # Nominatim pass and dispatched together afterwards, so the fallback
+    # calls are not interleaved with Nominatim's mandatory 1s pacing
+    google_queue = []
+
+    for record in tqdm(records, total=total, desc="Geocoding (Nominatim)"):
         record_id = record.id
         address_query = record.address_query
         settlement = record.settlement
@@ -595,116 +935,86 @@ def geocode_records(config, limit=None, municipality_limit=None):
         raw_json = nom_result.get('raw_json') or {}
         nom_settlement, nom_municipality, nom_region = extract_nominatim_address_parts(raw_json)
 
-        # Always store Nominatim result
-        with engine.connect() as conn:
-            update_query = text("""
-                UPDATE community_centers
-                SET 
-                    lon_nom = :lon_nom,
-                    lat_nom = :lat_nom,
-                    geom_nom = CASE 
-                        WHEN :lon_nom IS NOT NULL AND :lat_nom IS NOT NULL 
-                        THEN ST_SetSRID(ST_MakePoint(:lon_nom, :lat_nom), 4326)
-                        ELSE NULL 
-                    END,
-                    nom_display_name = :display_name,
-                    nom_osm_type = :osm_type,
-                    nom_osm_id = :osm_id,
-                    nom_importance = :importance,
-                    nom_class = :class,
-                    nom_type = :type,
-                    nom_confidence = :confidence,
-                    nom_raw_json = :raw_json,
-                    nom_settlement = :nom_settlement,
-                    nom_municipality = :nom_municipality,
-                    nom_region = :nom_region,
-                    nom_query_used = :nom_query_used,
-                    nom_queried_at = NOW(),
-                    updated_at = NOW()
-                WHERE id = :id
-            """)
-            
-            conn.execute(update_query, {
-                'id': record_id,
-                'lon_nom': nom_result.get('lon'),
-                'lat_nom': nom_result.get('lat'),
-                'display_name': nom_result.get('display_name'),
-                'osm_type': nom_result.get('osm_type'),
-                'osm_id': nom_result.get('osm_id'),
-                'importance': nom_result.get('importance'),
-                'class': nom_result.get('class'),
-                'type': nom_result.get('type'),
-                'confidence': nom_result.get('confidence', 0),
-                'raw_json': json.dumps(raw_json),
-                'nom_settlement': nom_settlement,
-                'nom_municipality': nom_municipality,
-                'nom_region': nom_region,
-                'nom_query_used': nom_result.get('query_used'),
-            })
-            conn.commit()
-        
+        # Build the Nominatim parameters (bind .get once instead of a
+        # method lookup per field)
+        nom_get = nom_result.get
+        nom_params = {
+            'id': record_id,
+            'lon_nom': nom_get('lon'),
+            'lat_nom': nom_get('lat'),
+            'display_name': nom_get('display_name'),
+            'osm_type': nom_get('osm_type'),
+            'osm_id': nom_get('osm_id'),
+            'importance': nom_get('importance'),
+            'class': nom_get('class'),
+            'type': nom_get('type'),
+            'confidence': nom_get('confidence', 0),
+            'raw_json': json_dumps(raw_json),
+            'nom_settlement': nom_settlement,
+            'nom_municipality': nom_municipality,
+            'nom_region': nom_region,
+            'nom_query_used': nom_get('query_used'),
+        }
+
         if nom_result['success']:
             stats['nominatim_success'] += 1
         else:
             stats['nominatim_failed'] += 1
-        
-        # Step 2: Decide if we need Google fallback
-        need_google = False
-        
-        if not nom_result['success']:
-            need_google = True
-        elif nom_result.get('confidence', 0) < min_confidence:
-            need_google = True
-        
-        # Step 3: Try Google if needed
-        if need_google:
-            stats['google_called'] += 1
-            google_result = google.geocode(address_query)
-            
-            # Store Google result
-            with engine.connect() as conn:
-                update_query = text("""
-                    UPDATE community_centers
-                    SET 
-                        lon_g = :lon_g,
-                        lat_g = :lat_g,
-                        geom_g = CASE 
-                            WHEN :lon_g IS NOT NULL AND :lat_g IS NOT NULL 
-                            THEN ST_SetSRID(ST_MakePoint(:lon_g, :lat_g), 4326)
-                            ELSE NULL 
-                        END,
-                        g_formatted_address = :formatted_address,
-                        g_place_id = :place_id,
-                        g_location_type = :location_type,
-                        g_types = :types,
-                        g_confidence = :confidence,
-                        g_raw_json = :raw_json,
-                        g_queried_at = NOW(),
-                        updated_at = NOW()
-                    WHERE id = :id
-                """)
-                
-                conn.execute(update_query, {
-                    'id': record_id,
-                    'lon_g': google_result.get('lon'),
-                    'lat_g': google_result.get('lat'),
-                    'formatted_address': google_result.get('formatted_address'),
-                    'place_id': google_result.get('place_id'),
-                    'location_type': google_result.get('location_type'),
-                    'types': json.dumps(google_result.get('types', [])),
-                    'confidence': google_result.get('confidence', 0),
-                    'raw_json': json.dumps(google_result.get('raw_json', {}))
-                })
-                conn.commit()
-            
+
+        # Step 2: Queue Google fallback when Nominatim failed or is low
+        # confidence. Queued records defer their Nominatim write: the
+        # Google pass issues one combined UPDATE for both providers
+        if not nom_result['success'] or nom_result.get('confidence', 0) < min_confidence:
+            google_queue.append((record_id, address_query, nom_params))
+        else:
+            nom_updates.append(nom_params)
+
+        if len(nom_updates) >= flush_every:
+            flush_updates()
+
+    flush_updates()
+    read_conn.close()
+
+    # Step 3: Google fallback pass over the queued records, dispatched on a
+    # thread pool (the calls are I/O-bound and Google has no 1 req/s policy).
+    # executor.map yields results in submission order, so the DB writes stay
+    # on the main thread and the batching below is unchanged
+    stats['google_called'] = len(google_queue)
+    with ThreadPoolExecutor(max_workers=google.MAX_WORKERS) as executor:
+        google_results = executor.map(
+            google.geocode, (q for _, q, _ in google_queue)
+        )
+        queue_iter = zip(google_queue, google_results)
+        for (record_id, address_query, nom_params), google_result in tqdm(
+                queue_iter, total=len(google_queue), desc="Geocoding (Google)"):
+            # Merge the deferred Nominatim parameters with the Google result
+            # into one combined UPDATE
+            g_get = google_result.get
+            nom_params.update({
+                'lon_g': g_get('lon'),
+                'lat_g': g_get('lat'),
+                'formatted_address': g_get('formatted_address'),
+                'place_id': g_get('place_id'),
+                'location_type': g_get('location_type'),
+                'types': json_dumps(g_get('types', [])),
+                'g_confidence': g_get('confidence', 0),
+                'g_raw_json': json_dumps(g_get('raw_json', {}))
+            })
+            combined_updates.append(nom_params)
+
             if google_result['success']:
                 stats['google_success'] += 1
             else:
                 stats['google_failed'] += 1
-    
-    # Close geocoders
+
+            if len(combined_updates) >= flush_every:
+                flush_updates()
+
+    # Write any remaining updates and close geocoders
+    flush_updates()
     nominatim.close()
     google.close()
+    cache.close()
     
     # Print statistics
     print("\n" + "="*60)